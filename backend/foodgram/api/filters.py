@@ -1,6 +1,6 @@
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Favourite, Ingredient, Recipe, ShoppingCart, Tag
 
 
 class IngredientFilter(FilterSet):
@@ -16,6 +16,7 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags'
     )
 
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
@@ -27,14 +28,27 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(
+            id__in=Recipe.tags.through.objects.filter(
+                tag__in=value
+            ).values('recipe_id')
+        )
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(favorites__user=user)
-        return queryset
+        if not value or not user.is_authenticated:
+            return queryset
+        return queryset.filter(
+            id__in=Favourite.objects.filter(user=user).values('recipe_id')
+        )
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(shopping_cart__user=user)
-        return queryset
+        if not value or not user.is_authenticated:
+            return queryset
+        return queryset.filter(
+            id__in=ShoppingCart.objects.filter(user=user).values('recipe_id')
+        )
@@ -1,6 +1,27 @@
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
 from rest_framework.pagination import PageNumberPagination
 
 
+class PrimaryKeyPaginator(Paginator):
+    """Пагинатор, отсчитывающий смещение только по первичным ключам.
+
+    OFFSET выполняется по узкому индексу id, а полные строки
+    со всеми join и подзапросами выбираются только для одной страницы.
+    """
+
+    def page(self, number):
+        page = super().page(number)
+        if isinstance(self.object_list, QuerySet):
+            page_ids = list(page.object_list.values_list('pk', flat=True))
+            page.object_list = self.object_list.filter(pk__in=page_ids)
+        return page
+
+
 class PageLimitPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipePagination(PageLimitPagination):
+    django_paginator_class = PrimaryKeyPaginator
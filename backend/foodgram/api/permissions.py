@@ -6,14 +6,16 @@
 """
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
+SAFE_METHODS_SET = frozenset(SAFE_METHODS)
+
 
 class IsAuthorAdminOrReadOnly(BasePermission):
     def has_permission(self, request, view):
         return (
-            request.method in SAFE_METHODS or request.user.is_authenticated
+            request.method in SAFE_METHODS_SET or request.user.is_authenticated
         )
 
     def has_object_permission(self, request, view, obj):
-        return (
-            request.method in SAFE_METHODS or obj.author == request.user
-        )
+        if request.method in SAFE_METHODS_SET:
+            return True
+        return obj.author_id == request.user.id
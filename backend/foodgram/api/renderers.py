@@ -0,0 +1,22 @@
+"""
+Модуль для пользовательских рендереров.
+
+Этот модуль предоставляет рендерер JSON на основе orjson,
+используемый для всех ответов API.
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(
+            data,
+            default=encoder.default,
+            option=orjson.OPT_NON_STR_KEYS
+        )
@@ -1,10 +1,22 @@
-from django.db import transaction
-from django.db.models import F
-from .utils import Base64ImageField
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils.functional import cached_property
+from .utils import (
+    Base64ImageField,
+    CachedFieldsMixin,
+    ImageUrlField,
+    parse_recipes_limit
+)
 from rest_framework.exceptions import ValidationError
-from rest_framework.fields import SerializerMethodField
-from rest_framework.relations import PrimaryKeyRelatedField
-from rest_framework.serializers import ModelSerializer
+from rest_framework.fields import (
+    BooleanField,
+    CurrentUserDefault,
+    HiddenField,
+    IntegerField,
+    ListField,
+    SerializerMethodField
+)
+from rest_framework.serializers import ModelSerializer, ReadOnlyField
 
 from users.models import Profile, Subscription
 from recipes.models import (
@@ -16,8 +28,10 @@ from recipes.models import (
     Favourite
 )
 
+INGREDIENTS_BATCH_SIZE = 1000
 
-class ProfileSerializer(ModelSerializer):
+
+class ProfileSerializer(CachedFieldsMixin, ModelSerializer):
     is_subscribed = SerializerMethodField()
 
     class Meta:
@@ -32,15 +46,24 @@ class ProfileSerializer(ModelSerializer):
             'avatar'
         )
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = request.user
+    @cached_property
+    def subscribed_author_ids(self):
+        author_ids = self.context.get('subscribed_author_ids')
+        if author_ids is None:
+            request = self.context.get('request')
+            if request and request.user.is_authenticated:
+                author_ids = set(request.user.followings.values_list(
+                    'author_id', flat=True
+                ))
+            else:
+                author_ids = frozenset()
+            self.context['subscribed_author_ids'] = author_ids
+        return author_ids
 
-        return (
-            request and user.is_authenticated and Subscription.objects.filter(
-                user=user, author=obj
-            ).exists()
-        )
+    def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in self.subscribed_author_ids
 
 
 class AvatarSerializer(ModelSerializer):
@@ -51,8 +74,8 @@ class AvatarSerializer(ModelSerializer):
         fields = ('avatar',)
 
 
-class RecipeShortSerializer(ModelSerializer):
-    image = Base64ImageField()
+class RecipeShortSerializer(CachedFieldsMixin, ModelSerializer):
+    image = ImageUrlField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -63,9 +86,17 @@ class RecipeShortSerializer(ModelSerializer):
             'cooking_time'
         )
 
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'image': self.fields['image'].to_representation(instance.image),
+            'cooking_time': instance.cooking_time,
+        }
+
 
 class UserSubscriptionSerializer(ProfileSerializer):
-    recipes_count = SerializerMethodField()
+    recipes_count = IntegerField(read_only=True)
     recipes = SerializerMethodField()
 
     class Meta:
@@ -74,41 +105,54 @@ class UserSubscriptionSerializer(ProfileSerializer):
                   'avatar', 'is_subscribed', 'recipes_count', 'recipes')
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
-    @staticmethod
-    def get_recipes_count(obj):
-        return obj.recipes.count()
+    @cached_property
+    def recipes_limit(self):
+        if 'recipes_limit' not in self.context:
+            self.context['recipes_limit'] = parse_recipes_limit(
+                self.context.get('request')
+            )
+        return self.context['recipes_limit']
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            try:
-                recipes = recipes[:int(limit)]
-            except ValueError:
-                pass
-        serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
-        return serializer.data
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+            if self.recipes_limit is not None:
+                recipes = recipes[:self.recipes_limit]
+        return RecipeShortSerializer(
+            recipes,
+            many=True,
+            context=self.context
+        ).data
 
 
 class SubscriptionSerializer(ModelSerializer):
+    user = HiddenField(default=CurrentUserDefault())
+
     class Meta:
         model = Subscription
         fields = ('user', 'author')
+        read_only_fields = ('author',)
+        validators = []
 
     def validate(self, data):
-        request = self.context.get('request')
-        user = request.user
-        author = data['author']
-
-        if user == author:
+        if data['user'] == self.context['author']:
             raise ValidationError('Нельзя подписаться на самого себя')
 
-        if Subscription.objects.filter(user=user, author=author).exists():
-            raise ValidationError('Вы уже подписаны на данного пользователя')
-
         return data
 
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            if not Subscription.objects.filter(
+                user=validated_data['user'],
+                author=validated_data['author']
+            ).exists():
+                raise
+            raise ValidationError('Вы уже подписаны на данного пользователя')
+
     def to_representation(self, instance):
         return UserSubscriptionSerializer(
             instance.author,
@@ -121,20 +165,57 @@ class IngredientSerializer(ModelSerializer):
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'measurement_unit': instance.measurement_unit,
+        }
+
 
 class TagSerializer(ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug')
 
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'slug': instance.slug,
+        }
+
 
-class RecipeReadSerializer(ModelSerializer):
+class IngredientInRecipeReadSerializer(ModelSerializer):
+    id = ReadOnlyField(source='ingredient.id')
+    name = ReadOnlyField(source='ingredient.name')
+    measurement_unit = ReadOnlyField(source='ingredient.measurement_unit')
+
+    class Meta:
+        model = IngredientInRecipe
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+    def to_representation(self, instance):
+        ingredient = instance.ingredient
+        return {
+            'id': ingredient.id,
+            'name': ingredient.name,
+            'measurement_unit': ingredient.measurement_unit,
+            'amount': instance.amount,
+        }
+
+
+class RecipeReadSerializer(CachedFieldsMixin, ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = ProfileSerializer(read_only=True)
-    ingredients = SerializerMethodField()
-    image = Base64ImageField()
-    is_favorited = SerializerMethodField(read_only=True)
-    is_in_shopping_cart = SerializerMethodField(read_only=True)
+    ingredients = IngredientInRecipeReadSerializer(
+        many=True,
+        source='ingredient_list',
+        read_only=True
+    )
+    image = ImageUrlField(read_only=True)
+    is_favorited = BooleanField(read_only=True, default=False)
+    is_in_shopping_cart = BooleanField(read_only=True, default=False)
 
     class Meta:
         model = Recipe
@@ -151,37 +232,33 @@ class RecipeReadSerializer(ModelSerializer):
             'cooking_time',
         )
 
-    def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            'id', 'name', 'measurement_unit',
-            amount=F('ingredientinrecipe__amount')
-        )
-
-    def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        user = request.user if request else None
-
-        return (
-            user and user.is_authenticated and user.favorites.filter(
-                recipe=obj
-            ).exists())
-
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        user = request.user if request else None
-
-        return (
-            user and user.is_authenticated and user.shopping_cart.filter(
-                recipe=obj
-            ).exists())
+    def to_representation(self, instance):
+        fields = self.fields
+        author = instance.author
+        if author and hasattr(instance, 'is_author_subscribed'):
+            author.is_subscribed = instance.is_author_subscribed
+        return {
+            'id': instance.id,
+            'tags': fields['tags'].to_representation(instance.tags.all()),
+            'author': (
+                fields['author'].to_representation(author) if author else None
+            ),
+            'ingredients': fields['ingredients'].to_representation(
+                instance.ingredient_list.all()
+            ),
+            'is_favorited': getattr(instance, 'is_favorited', False),
+            'is_in_shopping_cart': getattr(
+                instance, 'is_in_shopping_cart', False
+            ),
+            'name': instance.name,
+            'image': fields['image'].to_representation(instance.image),
+            'text': instance.text,
+            'cooking_time': instance.cooking_time,
+        }
 
 
 class IngredientInRecipeWriteSerializer(ModelSerializer):
-    id = PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient',
-        required=True
-    )
+    id = IntegerField(required=True)
 
     class Meta:
         model = IngredientInRecipe
@@ -189,11 +266,7 @@ class IngredientInRecipeWriteSerializer(ModelSerializer):
 
 
 class RecipeWriteSerializer(ModelSerializer):
-    tags = PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-        required=True
-    )
+    tags = ListField(child=IntegerField(), required=True)
     author = ProfileSerializer(read_only=True)
     ingredients = IngredientInRecipeWriteSerializer(many=True, required=True)
     image = Base64ImageField(required=True)
@@ -226,16 +299,12 @@ class RecipeWriteSerializer(ModelSerializer):
                 {'ingredients': 'Нужен хотя бы один ингредиент'}
             )
 
-        ingredients_list = []
-
-        for ingredient in ingredients:
-
-            if ingredient in ingredients_list:
-                raise ValidationError(
-                    {'ingredients': 'Ингредиенты не могут повторяться'}
-                )
+        ingredient_ids = {ingredient['id'] for ingredient in ingredients}
 
-            ingredients_list.append(ingredient)
+        if len(ingredient_ids) != len(ingredients):
+            raise ValidationError(
+                {'ingredients': 'Ингредиенты не могут повторяться'}
+            )
 
         tags = validated_data.get('tags', [])
 
@@ -244,29 +313,96 @@ class RecipeWriteSerializer(ModelSerializer):
                 {'tags': 'Нужно выбрать хотя бы один тег!'}
             )
 
-        tags_list = []
+        tag_ids = set(tags)
 
-        for tag in tags:
-            if tag in tags_list:
-                raise ValidationError(
-                    {'tags': 'Теги должны быть уникальными!'}
-                )
-            tags_list.append(tag)
+        if len(tag_ids) != len(tags):
+            raise ValidationError(
+                {'tags': 'Теги должны быть уникальными!'}
+            )
+
+        missing_ids = ingredient_ids - set(
+            Ingredient.objects.filter(
+                id__in=ingredient_ids
+            ).values_list('id', flat=True)
+        )
+
+        if missing_ids:
+            raise ValidationError(
+                {'ingredients': (
+                    'Указаны несуществующие ингредиенты: '
+                    f'{", ".join(map(str, sorted(missing_ids)))}'
+                )}
+            )
+
+        if Tag.objects.filter(id__in=tag_ids).count() != len(tag_ids):
+            raise ValidationError(
+                {'tags': 'Указан несуществующий тег'}
+            )
 
         return validated_data
 
     @staticmethod
-    @transaction.atomic
     def create_ingredients_amounts(ingredients, recipe):
-        ingredient_instances = [
-            IngredientInRecipe(
-                ingredient=ingredient['ingredient'],
-                recipe=recipe,
-                amount=ingredient['amount']
-            ) for ingredient in ingredients
-        ]
-        IngredientInRecipe.objects.bulk_create(ingredient_instances)
+        IngredientInRecipe.objects.bulk_create(
+            (
+                IngredientInRecipe(
+                    ingredient_id=ingredient['id'],
+                    recipe=recipe,
+                    amount=ingredient['amount']
+                ) for ingredient in ingredients
+            ),
+            batch_size=INGREDIENTS_BATCH_SIZE
+        )
+
+    @classmethod
+    def update_ingredients_amounts(cls, ingredients, recipe):
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        # Старые данные могут содержать повторы одного ингредиента:
+        # оставляем первую строку, остальные удаляем.
+        existing = {}
+        removed_ids = []
+        for row in recipe.ingredient_list.all():
+            ingredient_id = row.ingredient_id
+            if ingredient_id in existing or ingredient_id not in amounts:
+                removed_ids.append(row.id)
+            else:
+                existing[ingredient_id] = row
+        if removed_ids:
+            IngredientInRecipe.objects.filter(id__in=removed_ids).delete()
+
+        changed = []
+        for ingredient_id, row in existing.items():
+            if row.amount != amounts[ingredient_id]:
+                row.amount = amounts[ingredient_id]
+                changed.append(row)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(
+                changed, ['amount'], batch_size=INGREDIENTS_BATCH_SIZE
+            )
+
+        cls.create_ingredients_amounts(
+            [
+                ingredient for ingredient in ingredients
+                if ingredient['id'] not in existing
+            ],
+            recipe
+        )
 
+    @staticmethod
+    def update_tags(tags, recipe):
+        current_ids = {tag.id for tag in recipe.tags.all()}
+        tag_ids = set(tags)
+        removed_ids = current_ids - tag_ids
+        added_ids = tag_ids - current_ids
+        if removed_ids:
+            recipe.tags.remove(*removed_ids)
+        if added_ids:
+            recipe.tags.add(*added_ids)
+
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         author = request.user
@@ -275,11 +411,15 @@ class RecipeWriteSerializer(ModelSerializer):
         ingredients = validated_data.pop('ingredients')
 
         recipe = Recipe.objects.create(author=author, **validated_data)
-        recipe.tags.set(tags)
+        recipe.tags.add(*tags)
         self.create_ingredients_amounts(
             recipe=recipe,
             ingredients=ingredients
         )
+        # Новый рецепт ещё никем не добавлен, а на себя подписаться нельзя.
+        recipe.is_favorited = False
+        recipe.is_in_shopping_cart = False
+        recipe.is_author_subscribed = False
 
         return recipe
 
@@ -288,34 +428,47 @@ class RecipeWriteSerializer(ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
 
-        instance.tags.clear()
-        instance.ingredients.clear()
-
-        instance.tags.set(tags)
-        self.create_ingredients_amounts(ingredients, instance)
+        self.update_tags(tags, instance)
+        self.update_ingredients_amounts(ingredients, instance)
 
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'ingredient_list',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
         request = self.context.get('request')
         context = {'request': request}
         return RecipeReadSerializer(instance, context=context).data
 
 
-class FavoriteSerializer(ModelSerializer):
+class FavouriteShoppingCartBaseSerializer(ModelSerializer):
+    user = HiddenField(default=CurrentUserDefault())
+    already_added_message = None
+
     class Meta:
-        model = Favourite
         fields = ('user', 'recipe',)
+        read_only_fields = ('recipe',)
+        validators = []
 
-    def validate(self, data):
-        user = data['user']
-        recipe = data['recipe']
-
-        if user.favorites.filter(recipe=recipe.id).exists():
-            raise ValidationError(
-                'Рецепт уже добавлен в избранное.'
-            )
-        return data
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            if not self.Meta.model.objects.filter(
+                user=validated_data['user'],
+                recipe=validated_data['recipe']
+            ).exists():
+                raise
+            raise ValidationError(self.already_added_message)
 
     def to_representation(self, instance):
         return RecipeShortSerializer(
@@ -324,23 +477,15 @@ class FavoriteSerializer(ModelSerializer):
         ).data
 
 
-class ShoppingCartSerializer(ModelSerializer):
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe',)
+class FavoriteSerializer(FavouriteShoppingCartBaseSerializer):
+    already_added_message = 'Рецепт уже добавлен в избранное.'
 
-    def validate(self, data):
-        user = data['user']
-        recipe = data['recipe']
+    class Meta(FavouriteShoppingCartBaseSerializer.Meta):
+        model = Favourite
 
-        if user.shopping_cart.filter(recipe=recipe.id).exists():
-            raise ValidationError(
-                'Рецепт уже добавлен в корзину'
-            )
-        return data
 
-    def to_representation(self, instance):
-        return RecipeShortSerializer(
-            instance.recipe,
-            context={'request': self.context.get('request')}
-        ).data
+class ShoppingCartSerializer(FavouriteShoppingCartBaseSerializer):
+    already_added_message = 'Рецепт уже добавлен в корзину'
+
+    class Meta(FavouriteShoppingCartBaseSerializer.Meta):
+        model = ShoppingCart
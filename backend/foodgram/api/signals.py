@@ -0,0 +1,19 @@
+"""
+Модуль для сброса кэша справочных данных.
+
+Списки тегов и ингредиентов кэшируются целиком, поэтому
+любое изменение этих моделей очищает кэш справочников.
+"""
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, Tag
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def clear_reference_cache(**kwargs):
+    caches['reference'].clear()
@@ -4,18 +4,98 @@
 Этот модуль предоставляет вспомогательные функции и пользовательские поля,
 используемые в сериализаторах и моделях.
 """
+import copy
+import re
 import uuid
+
+import pybase64
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 
-import base64
+IMAGE_FORMATS = frozenset(('jpeg', 'jpg', 'png', 'gif', 'webp', 'bmp'))
+BASE64_CHUNK_SIZE = 64 * 1024
+DATA_URI_RE = re.compile(r'data:image/(?P<ext>[A-Za-z0-9]+);base64,')
+
+
+def parse_recipes_limit(request):
+    """Возвращает неотрицательный recipes_limit из запроса или None."""
+    if request is None:
+        return None
+    try:
+        limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return limit if limit >= 0 else None
+
+
+class CachedFieldsMixin:
+    """Собирает поля сериализатора один раз на класс.
+
+    Интроспекция модели в ModelSerializer.get_fields выполняется
+    при первом создании сериализатора, далее выдаются копии полей.
+    """
+
+    def get_fields(self):
+        cls = type(self)
+        if '_cached_fields' not in cls.__dict__:
+            cls._cached_fields = super().get_fields()
+        return copy.deepcopy(cls._cached_fields)
 
 
-class Base64ImageField(serializers.ImageField):
+class ImageUrlField(serializers.ImageField):
+    """Отдаёт абсолютный URL изображения.
+
+    Префикс адреса вычисляется один раз на запрос и хранится в контексте.
+    """
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        if not value or not self.use_url or request is None:
+            return super().to_representation(value)
+
+        if 'absolute_uri_prefix' not in self.context:
+            self.context['absolute_uri_prefix'] = (
+                request.build_absolute_uri('/').rstrip('/')
+            )
+        return self.context['absolute_uri_prefix'] + value.url
+
+
+class Base64ImageField(ImageUrlField):
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            id = uuid.uuid4()
-            data = ContentFile(base64.b64decode(imgstr), name=f"{id}.{ext}")
-        return super().to_internal_value(data)
+        match = isinstance(data, str) and DATA_URI_RE.match(data)
+        if not match:
+            return super().to_internal_value(data)
+
+        ext = match.group('ext').lower()
+        if ext not in IMAGE_FORMATS:
+            self.fail('invalid_image')
+        imgstr = data[match.end():]
+        name = f'{uuid.uuid4().hex}.{ext}'
+        try:
+            if len(imgstr) > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+                file = self.decode_to_temporary_file(imgstr, name, ext)
+            else:
+                file = ContentFile(pybase64.b64decode(imgstr), name=name)
+        except ValueError:
+            self.fail('invalid_image')
+        return super().to_internal_value(file)
+
+    @staticmethod
+    def decode_to_temporary_file(imgstr, name, ext):
+        # Куски декодируются по границам групп из четырёх символов,
+        # поэтому переносы строк и пробелы убираются заранее.
+        imgstr = ''.join(imgstr.split())
+        file = TemporaryUploadedFile(name, f'image/{ext}', 0, None)
+        try:
+            for start in range(0, len(imgstr), BASE64_CHUNK_SIZE):
+                file.write(pybase64.b64decode(
+                    imgstr[start:start + BASE64_CHUNK_SIZE], validate=True
+                ))
+        except ValueError:
+            file.close()
+            raise
+        file.size = file.tell()
+        file.seek(0)
+        return file
@@ -1,26 +1,30 @@
 from datetime import datetime
-
-from django.db.models import Sum
-from django.http import HttpResponse, HttpResponseRedirect
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import (
+    Count,
+    Exists,
+    OuterRef,
+    Prefetch,
+    Sum,
+    Value
+)
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.cache import add_never_cache_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_page
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.status import HTTP_400_BAD_REQUEST
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
 from users.models import Profile, Subscription
-from .serializers import (
-    ShoppingCartSerializer,
-    FavoriteSerializer,
-    UserSubscriptionSerializer,
-    AvatarSerializer,
-    SubscriptionSerializer
-)
 from recipes.models import (
     Favourite,
     Ingredient,
@@ -30,19 +34,45 @@ from recipes.models import (
     Tag
 )
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import PageLimitPagination
+from .pagination import PageLimitPagination, RecipePagination
+from .permissions import SAFE_METHODS_SET, IsAuthorAdminOrReadOnly
 from .serializers import (
+    AvatarSerializer,
+    FavoriteSerializer,
     IngredientSerializer,
     RecipeReadSerializer,
     RecipeWriteSerializer,
-    TagSerializer
+    ShoppingCartSerializer,
+    SubscriptionSerializer,
+    TagSerializer,
+    UserSubscriptionSerializer
 )
-from .permissions import IsAuthorAdminOrReadOnly
+from .utils import parse_recipes_limit
+
+PROFILE_FIELDS = (
+    'id', 'email', 'username', 'first_name', 'last_name', 'avatar'
+)
+READ_ACTIONS = ('list', 'retrieve')
+RECIPE_SHORT_FIELDS = ('id', 'name', 'image', 'cooking_time')
+SHOPPING_LIST_CHUNK_SIZE = 500
 
 
 class ProfileViewSet(UserViewSet):
     pagination_class = PageLimitPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in READ_ACTIONS:
+            queryset = queryset.only(*PROFILE_FIELDS)
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    user=user, author=OuterRef('pk')
+                ))
+            )
+        return queryset
+
     @action(
         detail=False,
         methods=['get'],
@@ -57,30 +87,32 @@ class ProfileViewSet(UserViewSet):
         permission_classes=[IsAuthenticated]
     )
     def subscribe(self, request, **kwargs):
-        user = request.user
-        author = get_object_or_404(Profile, id=self.kwargs.get('id'))
+        author = get_object_or_404(
+            Profile.objects.annotate(
+                is_subscribed=Value(True),
+                recipes_count=Count('recipes')
+            ),
+            id=self.kwargs.get('id')
+        )
 
         serializer = SubscriptionSerializer(
-            data={'author': author.id,
-                  'user': user.id},
-            context={'request': request}
+            data={},
+            context={'request': request, 'author': author}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=user)
+        serializer.save(author=author)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def del_subscribe(self, request, id=None):
-        user = request.user
-        author = get_object_or_404(Profile, id=id)
-
         deleted_count, _ = Subscription.objects.filter(
-            user=user,
-            author=author
+            user=request.user,
+            author_id=id
         ).delete()
 
         if deleted_count == 0:
+            get_object_or_404(Profile.objects.only('id'), id=id)
             return Response(
                 {'errors': 'Вы не подписаны на этого пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -90,7 +122,19 @@ class ProfileViewSet(UserViewSet):
 
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        queryset = Profile.objects.filter(followers__user=request.user)
+        recipes = Recipe.objects.only(*RECIPE_SHORT_FIELDS, 'author_id')
+        limit = parse_recipes_limit(request)
+        if limit is not None:
+            recipes = recipes[:limit]
+
+        queryset = Profile.objects.filter(
+            followers__user=request.user
+        ).only(*PROFILE_FIELDS).annotate(
+            is_subscribed=Value(True),
+            recipes_count=Count('recipes')
+        ).prefetch_related(Prefetch(
+            'recipes', queryset=recipes, to_attr='limited_recipes'
+        ))
         serializer = UserSubscriptionSerializer(
             self.paginate_queryset(queryset),
             many=True,
@@ -107,13 +151,15 @@ class ProfileViewSet(UserViewSet):
     )
     def avatar(self, request):
         user = request.user
-        serializer = AvatarSerializer(data=request.data)
+        serializer = AvatarSerializer(
+            data=request.data,
+            context={'request': request}
+        )
         serializer.is_valid(raise_exception=True)
         user.avatar = serializer.validated_data['avatar']
-        user.save()
-        avatar_url = request.build_absolute_uri(user.avatar.url)
+        user.save(update_fields=['avatar'])
         return Response(
-            {'avatar': avatar_url},
+            serializer.to_representation(user),
             status=status.HTTP_200_OK
         )
 
@@ -121,17 +167,57 @@ class ProfileViewSet(UserViewSet):
     def delete_avatar(self, request):
         user = request.user
         user.avatar = None
-        user.save()
+        user.save(update_fields=['avatar'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def shopping_list_lines(user, ingredients):
+    today = datetime.today()
+    yield (
+        f'Список покупок для: {user.get_full_name()}\n\n'
+        f'Дата: {today:%Y-%m-%d}\n\n'
+    )
+    separator = ''
+    for name, measurement_unit, amount in ingredients:
+        yield f'{separator}- {name} ({measurement_unit}) - {amount}'
+        separator = '\n'
+    yield f'\n\nFoodgram ({today:%Y})'
+
+
 def redirect_to_recipe(request, recipe_hash):
-    recipe = get_object_or_404(Recipe, short_link_hash=recipe_hash)
+    recipe = get_object_or_404(
+        Recipe.objects.only('id'), short_link_hash=recipe_hash
+    )
     relative_url = '/recipes/' + str(recipe.pk) + '/'
     full_url = request.build_absolute_uri(relative_url)
     return HttpResponseRedirect(full_url)
 
 
+def without_client_cache(view):
+    """Запрещает кэширование ответа на стороне клиента.
+
+    cache_page выставляет Cache-Control: max-age и Expires, а сброс
+    кэша справочников при изменениях происходит только на сервере.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = view(*args, **kwargs)
+        response.headers.pop('Expires', None)
+        add_never_cache_headers(response)
+        return response
+    return wrapper
+
+
+reference_cache = method_decorator(
+    [
+        without_client_cache,
+        cache_page(settings.REFERENCE_CACHE_TIMEOUT, cache='reference')
+    ],
+    name='dispatch'
+)
+
+
+@reference_cache
 class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -139,7 +225,13 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     http_method_names = ['get']
 
+    def filter_queryset(self, queryset):
+        if not self.request.query_params:
+            return queryset
+        return super().filter_queryset(queryset)
+
 
+@reference_cache
 class TagViewSet(ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -149,13 +241,52 @@ class TagViewSet(ReadOnlyModelViewSet):
 class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorAdminOrReadOnly,)
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'delete']
 
+    def get_queryset(self):
+        if self.action == 'destroy':
+            return Recipe.objects.only('id', 'author')
+        if self.action == 'get_link':
+            return Recipe.objects.only('id', 'short_link_hash')
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient_list',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+        if self.action in READ_ACTIONS:
+            queryset = queryset.only(
+                'id', 'name', 'image', 'text', 'cooking_time',
+                *(f'author__{field}' for field in PROFILE_FIELDS)
+            )
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(Favourite.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                is_author_subscribed=Exists(Subscription.objects.filter(
+                    user=user, author=OuterRef('author')
+                ))
+            )
+        else:
+            queryset = queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False)
+            )
+        return queryset
+
     def get_serializer_class(self):
-        if self.request.method in SAFE_METHODS:
+        if self.request.method in SAFE_METHODS_SET:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
@@ -172,78 +303,57 @@ class RecipeViewSet(ModelViewSet):
 
         return Response({'short-link': short_link})
 
-    @action(
-        detail=True,
-        methods=['post'],
-        permission_classes=[IsAuthenticated])
-    def favorite(self, request, pk):
-        context = {'request': request}
-        data = {
-            'user': request.user.id,
-            'recipe': pk
-        }
+    def add_recipe(self, request, pk, serializer_class):
         try:
-            _ = Recipe.objects.get(id=pk)
+            recipe = Recipe.objects.only(*RECIPE_SHORT_FIELDS).get(id=pk)
         except Recipe.DoesNotExist:
             return Response({
                 'errors': 'Рецепт не найден'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = FavoriteSerializer(data=data, context=context)
+        serializer = serializer_class(data={}, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(recipe=recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @favorite.mapping.delete
-    def delete_favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        deleted_count, _ = Favourite.objects.filter(
+    def remove_recipe(self, request, pk, model, not_found_message):
+        deleted_count, _ = model.objects.filter(
             user=request.user,
-            recipe=recipe
+            recipe_id=pk
         ).delete()
 
-        if deleted_count == 0:
-            return Response({'errors': 'Рецепт не найден в вашем избранном'},
-                            status=status.HTTP_400_BAD_REQUEST)
+        if deleted_count:
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe.objects.only('id'), id=pk)
+        return Response({'errors': not_found_message},
+                        status=status.HTTP_400_BAD_REQUEST)
 
     @action(
         detail=True,
         methods=['post'],
         permission_classes=[IsAuthenticated])
-    def shopping_cart(self, request, pk):
-        context = {'request': request}
-        data = {
-            'user': request.user.id,
-            'recipe': pk
-        }
+    def favorite(self, request, pk):
+        return self.add_recipe(request, pk, FavoriteSerializer)
 
-        try:
-            _ = Recipe.objects.get(id=pk)
-        except Recipe.DoesNotExist:
-            return Response({
-                'errors': 'Рецепт не найден'
-            }, status=status.HTTP_404_NOT_FOUND)
+    @favorite.mapping.delete
+    def delete_favorite(self, request, pk):
+        return self.remove_recipe(
+            request, pk, Favourite, 'Рецепт не найден в вашем избранном'
+        )
 
-        serializer = ShoppingCartSerializer(data=data, context=context)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    @action(
+        detail=True,
+        methods=['post'],
+        permission_classes=[IsAuthenticated])
+    def shopping_cart(self, request, pk):
+        return self.add_recipe(request, pk, ShoppingCartSerializer)
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        deleted_count, _ = ShoppingCart.objects.filter(
-            user=request.user,
-            recipe=recipe
-        ).delete()
-
-        if deleted_count == 0:
-            return Response({'errors': 'Рецепт не найден в вашей корзине'},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.remove_recipe(
+            request, pk, ShoppingCart, 'Рецепт не найден в вашей корзине'
+        )
 
     @action(
         detail=False,
@@ -251,31 +361,26 @@ class RecipeViewSet(ModelViewSet):
     )
     def download_shopping_cart(self, request):
         user = request.user
-        if not user.shopping_cart.exists():
-            return Response(status=HTTP_400_BAD_REQUEST)
+        if not ShoppingCart.objects.filter(user=user).exists():
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
         ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
+            recipe__shopping_cart__user=user
+        ).values_list(
             'ingredient__name',
             'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-
-        today = datetime.today()
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
+        ).annotate(amount=Sum('amount')).order_by(
+            'ingredient__name'
+        ).iterator(
+            chunk_size=SHOPPING_LIST_CHUNK_SIZE
         )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        shopping_list += f'\n\nFoodgram ({today:%Y})'
 
         filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        response = StreamingHttpResponse(
+            shopping_list_lines(user, ingredients),
+            content_type='text/plain'
+        )
         response['Content-Disposition'] = f'attachment; filename={filename}'
+        response['X-Accel-Buffering'] = 'no'
 
         return response
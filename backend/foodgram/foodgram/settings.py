@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from pathlib import Path
 from dotenv import load_dotenv
@@ -44,6 +45,11 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 DJOSER = {
@@ -100,6 +106,21 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reference': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'REFERENCE_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_reference_cache')
+        ),
+    },
+}
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
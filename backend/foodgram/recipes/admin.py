@@ -1,6 +1,7 @@
 
 from django.contrib import admin
 from django.contrib.admin import display
+from django.db.models import Count
 
 from .models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
                      ShoppingCart, Tag)
@@ -17,10 +18,19 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     readonly_fields = ('added_in_favorites',)
     list_filter = ('author', 'name', 'tags',)
+    list_select_related = ('author',)
 
-    @display(description='Количество в избранных')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            favorites_count=Count('favorites', distinct=True)
+        )
+
+    @display(
+        description='Количество в избранных',
+        ordering='favorites_count'
+    )
     def added_in_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(Ingredient)
@@ -47,3 +57,4 @@ class FavouriteAdmin(admin.ModelAdmin):
 @admin.register(IngredientInRecipe)
 class IngredientInRecipe(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount',)
+    list_select_related = ('recipe', 'ingredient',)
@@ -1,8 +1,11 @@
 import csv
+from django.core.cache import caches
 from django.core.management.base import BaseCommand
 
 from recipes.models import Ingredient
 
+INGREDIENTS_BATCH_SIZE = 1000
+
 
 class Command(BaseCommand):
     """Загрузка csv файлов."""
@@ -15,17 +18,18 @@ class Command(BaseCommand):
         path = options['path']
         try:
             with open(path, mode="r", encoding="utf-8") as csvfile:
-                for row in csv.reader(csvfile):
-                    name, units = row
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=units
-                    )
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=units)
+                     for name, units in csv.reader(csvfile)),
+                    batch_size=INGREDIENTS_BATCH_SIZE,
+                    ignore_conflicts=True
+                )
+            caches['reference'].clear()
         except FileNotFoundError:
             raise FileNotFoundError(f'Ошибка: файл {path} не найден')
         else:
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'{len(Ingredient.objects.all())} записей добавлено'
+                    f'{Ingredient.objects.count()} записей добавлено'
                 )
             )
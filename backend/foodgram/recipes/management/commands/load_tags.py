@@ -1,4 +1,5 @@
 import csv
+from django.core.cache import caches
 from django.core.management.base import BaseCommand
 
 from recipes.models import Tag
@@ -15,17 +16,17 @@ class Command(BaseCommand):
         path = options['path']
         try:
             with open(path, mode="r", encoding="utf-8") as csvfile:
-                for row in csv.reader(csvfile):
-                    name, slug = row
-                    print(row)
-                    Tag.objects.get_or_create(
-                        name=name, slug=slug
-                    )
+                Tag.objects.bulk_create(
+                    (Tag(name=name, slug=slug)
+                     for name, slug in csv.reader(csvfile)),
+                    ignore_conflicts=True
+                )
+            caches['reference'].clear()
         except FileNotFoundError:
             raise FileNotFoundError(f'Ошибка: файл {path} не найден')
         else:
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'{len(Tag.objects.all())} записей добавлено'
+                    f'{Tag.objects.count()} записей добавлено'
                 )
             )
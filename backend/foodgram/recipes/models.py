@@ -34,6 +34,13 @@ class Ingredient(models.Model):
             UniqueConstraint(fields=['name', 'measurement_unit'],
                              name='unique_ingredient')
         ]
+        indexes = [
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_prefix',
+                opclasses=['varchar_pattern_ops']
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -64,7 +71,8 @@ class Recipe(models.Model):
     short_link_hash = models.CharField(
         'Хэш короткой ссылки',
         max_length=SHORT_LINK_HASH,
-        blank=True
+        blank=True,
+        db_index=True
     )
     author = models.ForeignKey(
         Profile,
@@ -110,6 +118,8 @@ class Recipe(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        if self.short_link_hash:
+            return
         recipe_hash = hashlib.md5(
             str(
                 self.id
@@ -163,6 +173,7 @@ class FavouriteShoppingCartBase(models.Model):
     user = models.ForeignKey(
         Profile,
         on_delete=models.CASCADE,
+        db_index=False,  # покрыт уникальным индексом (user, recipe)
         verbose_name='Пользователь',
     )
     recipe = models.ForeignKey(
@@ -42,6 +42,7 @@ class Subscription(models.Model):
     user = models.ForeignKey(
         Profile,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='followings'
     )
     author = models.ForeignKey(